@@ -1,11 +1,13 @@
 """Tokenizer modules to be used by transins. Moses is added as an example by default."""
 import logging
-from typing import List
+from functools import lru_cache, wraps
+from typing import List, Tuple
 
 
 def check_lang(func):
     """Check if language is supported. Used as a decorator."""
 
+    @wraps(func)
     def tokenize(self, text, lang):
         if lang not in self.languages:
             raise TypeError(f"Language {lang} not supported!")
@@ -21,7 +23,6 @@ class Tokenizer:
     def __init__(self) -> None:
         self.languages = []  # List of supported languages
 
-    @check_lang
     def tokenize(self, text: str, lang: str) -> List[str]:
         """
         Tokenize text given a language.
@@ -39,6 +40,9 @@ class Tokenizer:
         tokens : List[str]
             List of tokens
         """
+        if lang not in self.languages:
+            raise TypeError(f"Language {lang} not supported!")
+
         raise NotImplementedError
 
     def detokenize(self, tokens: List[str]) -> str:
@@ -111,14 +115,13 @@ class TokenizerGroup(Tokenizer):
             tokenizer.detokenize = MosesTokenizer().detokenize
 
         for lang in tokenizer.languages:
-            if lang not in self.languages:
+            if lang not in self.language_tokenizer_map:  # Dict lookup rather than scanning the languages list
                 self.languages.append(lang)
 
             self.language_tokenizer_map[
                 lang
             ] = tokenizer  # Override original if it was there.
 
-    @check_lang
     def tokenize(self, text: str, lang: str) -> List[str]:
         """
         Tokenize text given a language. Routes to tokenizer object based on language.
@@ -136,6 +139,10 @@ class TokenizerGroup(Tokenizer):
         tokens : List[str]
             List of tokens
         """
+        # Checked inline rather than with check_lang to save a call per tokenize.
+        if lang not in self.language_tokenizer_map:
+            raise TypeError(f"Language {lang} not supported!")
+
         tokenizer_to_use = self.language_tokenizer_map[lang]
 
         output = tokenizer_to_use.tokenize(text, lang)
@@ -189,6 +196,10 @@ class TokenizerGroup(Tokenizer):
 class MosesTokenizer(Tokenizer):
     """Basic tokenizer based on Moses."""
 
+    # Shared across instances so the sacremoses setup and regex compilation is only paid once.
+    _moses_tokenizer = None
+    _moses_detokenizer = None
+
     def __init__(self):
         """
         Populate required attributes: tokenizer, detokenizer, languages.
@@ -203,12 +214,30 @@ class MosesTokenizer(Tokenizer):
         """
         super(MosesTokenizer, self).__init__()
 
-        import sacremoses  # Import sacremoses to use moses tokenizer
+        if MosesTokenizer._moses_tokenizer is None:
+            import sacremoses  # Import sacremoses to use moses tokenizer
 
-        self.tokenizer = sacremoses.MosesTokenizer()
-        self.detokenizer = sacremoses.MosesDetokenizer()
+            moses_tokenizer = sacremoses.MosesTokenizer()
+            moses_detokenizer = sacremoses.MosesDetokenizer()
+
+            # Warm up so that the first real call does not pay for compiling the regexes.
+            moses_tokenizer.tokenize("warmup", return_str=False)
+            moses_detokenizer.detokenize(["warmup"])
+
+            MosesTokenizer._moses_tokenizer = moses_tokenizer
+            MosesTokenizer._moses_detokenizer = moses_detokenizer
+
+        self.tokenizer = MosesTokenizer._moses_tokenizer
+        self.detokenizer = MosesTokenizer._moses_detokenizer
         self.languages = ["en", "es"]
 
+        # Markup tends to repeat the same short strings (menus, whitespace, boilerplate), so memoize per instance.
+        self._tokenize_cached = lru_cache(maxsize=4096)(self._tokenize_uncached)
+
+    def _tokenize_uncached(self, text: str, lang: str) -> Tuple[str, ...]:
+        """Tokenize without going through the cache. Returns a tuple so cached results cannot be mutated by callers."""
+        return tuple(self.tokenizer.tokenize(text, return_str=False))
+
     def tokenize(self, text: str, lang: str):
         """
         Implement basic moses tokenizer.
@@ -226,7 +255,7 @@ class MosesTokenizer(Tokenizer):
         tokens : List[str]
             List of tokens
         """
-        tokens = self.tokenizer.tokenize(text, return_str=False)
+        tokens = list(self._tokenize_cached(text, lang))
         return tokens
 
     def detokenize(self, tokens: List[str]):
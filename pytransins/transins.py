@@ -1,19 +1,30 @@
 """Module to handle markup extraction and reinsertion."""
 import logging
-from collections import OrderedDict
+import sys
+from bisect import bisect_left
+from collections import defaultdict
 from typing import List, Union
 
-from bs4 import BeautifulSoup
+from bs4 import builder_registry
+from bs4.builder import TreeBuilder
 from bs4.element import Comment, NavigableString, Tag
 
 from pytransins.tokenizer import MosesTokenizer, Tokenizer, TokenizerGroup
-from pytransins.utils import compare_markup, get_opening_tag, is_tag
+from pytransins.utils import (
+    compare_markup,
+    contains_markup,
+    get_closing_tag,
+    get_opening_tag,
+    parse_markup,
+)
 
 
 class TransIns:
     """Class to orchestrate extraction and reinsertion of markup via the Complete Mapping Strategy as described by the 2019 EMNLP paper TransIns."""
 
-    def __init__(self, tokenizer: Union[None, Tokenizer] = None) -> None:
+    def __init__(
+        self, tokenizer: Union[None, Tokenizer] = None, parser: str = "html.parser"
+    ) -> None:
         """
         Initialize TransIns object to handle markup extraction and reinsertion.
 
@@ -21,6 +32,8 @@ class TransIns:
         ----------
         tokenizer : Union[None, Tokenizer]
             Tokenizer to use. If set to None, will initialize MosesTokenizer. (default None)
+        parser : str
+            BeautifulSoup parser to use for extraction, e.g. "lxml" for the faster C-backed parser. Falls back to html.parser if not installed. Wrapping html, head and body tags inserted by the parser are removed. (default html.parser)
 
         Returns
         -------
@@ -28,6 +41,12 @@ class TransIns:
         """
 
         self.logger = logging.getLogger("pytransins")
+
+        self.parser = parser
+        self._builder = None  # Tree builder reused for every parse
+        self._builder_parser = None  # Parser the tree builder was created for
+        self._get_builder()  # Check the parser is available up front
+
         if tokenizer is None:
             tokenizer = MosesTokenizer()
 
@@ -47,6 +66,9 @@ class TransIns:
 
         self.tokenizer.add_tokenizer(tokenizer)
 
+        # Tokenize function used while extracting. Resolved per language in extract_markup.
+        self._active_tokenize = self.tokenizer.tokenize
+
         self.self_closing = [
             "area",
             "base",
@@ -69,17 +91,51 @@ class TransIns:
 
         self.dnt = ["script", "style"]  # Do not translate tags
 
+        # Frozen copies of self_closing and dnt for fast membership checks. Refreshed on every extract_markup call.
+        self._self_closing_set = frozenset(self.self_closing)
+        self._dnt_set = frozenset(self.dnt)
+
         self.tag_id_map = {}  # Maps tag IDs to actual tags
+        self._next_tag_id = 0  # Next tag ID to assign. 0 goes to the <[document]> root.
 
         # Source version
-        self.tag_map = {}
+        self.tag_map = defaultdict(list)
         self.tokens = []
-        self.no_token_tags = {}
+        self.no_token_tags = defaultdict(list)
 
         # Target version
-        self.tgt_tag_map = {}
+        self.tgt_tag_map = defaultdict(list)
         self.tgt_tokens = []
-        self.tgt_no_token_tags = {}
+        self.tgt_no_token_tags = defaultdict(list)
+
+    def _get_builder(self) -> TreeBuilder:
+        """
+        Get the tree builder for the parser attribute, creating a new one if the parser was changed since the last call.
+
+        Falls back to html.parser if the parser is not installed.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        builder : bs4.builder.TreeBuilder
+            Tree builder instance for the parser
+        """
+        if self._builder_parser != self.parser:
+            builder_cls = builder_registry.lookup(self.parser)
+            if builder_cls is None:
+                self.logger.warning(
+                    "Parser %s not available. Defaulting to html.parser", self.parser
+                )
+                self.parser = "html.parser"
+                builder_cls = builder_registry.lookup(self.parser)
+
+            self._builder = builder_cls()
+            self._builder_parser = self.parser
+
+        return self._builder
 
     def _extract_markup(
         self, element: Tag, offset: int = 0, lang: str = "en"
@@ -87,12 +143,16 @@ class TransIns:
         """
         Traverses down the document tree (depth first) from a given element to populate the tag_map and no_token_tags dictionaries.
 
+        Uses an explicit stack rather than recursion, so documents nested deeper than the recursion limit can be processed.
+
         Parameters
         ----------
         element : bs4.element.Tag
-            The root element to start recursing down
+            The root element to start traversing down
         offset : int (default 0)
             An offset to keep track of how many tokens have been generated
+        lang : str (default en)
+            Language to use for tokenizer
 
 
         Returns
@@ -100,81 +160,101 @@ class TransIns:
         token_buffer : List[str]
             A list containing the plaintext tokens extracted
         """
-        # Assign a tag ID to the tag
-        if not self.tag_id_map:
-            tag_id = 0
+        token_buffer = []
 
-        else:
-            tag_id = max(self.tag_id_map.keys()) + 1
+        # Bind attributes used per node to locals, the loop below runs once per DOM node
+        tokenize = self._active_tokenize
+        tag_map = self.tag_map
+        no_token_tags = self.no_token_tags
+        tag_id_map = self.tag_id_map
+        dnt_set = self._dnt_set
+        self_closing_set = self._self_closing_set
+        next_tag_id = self._next_tag_id
+        intern = sys.intern
 
-        if (
-            type(element) == NavigableString
-        ):  # Text Node, without any child tags. No more markup to process.
-            token_buffer = self.tokenizer.tokenize(element.text, lang=lang)
-            return token_buffer
+        # Exact class checks on purpose: other NavigableString subclasses (e.g. Doctype) are dropped below
+        text_cls = NavigableString
+        comment_cls = Comment
 
-        elif type(element) == Comment:
-            self.tag_id_map[tag_id] = f"<!-- {str(element)} -->"
-            if offset not in self.no_token_tags:
-                self.no_token_tags[offset] = []
+        # Tags whose children are still being traversed, as (element, tag ID, token offset at which the tag started, iterator over remaining children)
+        stack = []
 
-            self.no_token_tags[offset].append(tag_id)
-            return []
+        while element is not None or stack:
+            if element is not None:
+                element_offset = offset + len(token_buffer)
 
-        try:
-            children = element.contents
-
-        except Exception as exc:
-            self.logger.warning(
-                f"Dropping tag as could not get children of non text node and non comment: {exc}"
-            )
-            return []
+                if (
+                    element.__class__ is text_cls
+                ):  # Text Node, without any child tags. No more markup to process.
+                    tokens = tokenize(element.text, lang)
+                    if tokens:
+                        # The tags open on the stack are exactly the tags around this text, innermost first
+                        tags = [entry[1] for entry in reversed(stack)]
 
-        self.tag_id_map[tag_id] = get_opening_tag(element)
+                        # Every token gets its own copy, so editing one token's tags cannot change its neighbours
+                        for i in range(element_offset, element_offset + len(tokens)):
+                            tag_map[i] = tags.copy()
 
-        # Has children, but not any text nodes. Wrap entire element as 1, without further processing. Also include do not translate tags
-        if (children and not element.text) or element.name in self.dnt:
-            self.tag_id_map[tag_id] += (
-                "".join(str(child) for child in children) + f"</{element.name}>"
-            )
-            if offset not in self.no_token_tags:
-                self.no_token_tags[offset] = []
+                        token_buffer.extend(tokens)
 
-            self.no_token_tags[offset].append(tag_id)
-            return []
+                elif element.__class__ is comment_cls:
+                    tag_id = next_tag_id
+                    next_tag_id += 1
+                    tag_id_map[tag_id] = f"<!-- {str(element)} -->"
+                    no_token_tags[element_offset].append(tag_id)
 
-        token_buffer = []
+                else:
+                    try:
+                        children = element.contents
 
-        for child in children:
-            child_tokens = self._extract_markup(
-                child, offset=offset + len(token_buffer)
-            )  # Recurse over each child
+                    except Exception as exc:
+                        self.logger.warning(
+                            "Dropping tag as could not get children of non text node and non comment: %s",
+                            exc,
+                        )
+                        children = None
+
+                    if children is not None:
+                        # Assign a tag ID to the tag
+                        tag_id = next_tag_id
+                        next_tag_id += 1
+
+                        # Has children, but not any text nodes. Wrap entire element as 1, without further processing. Also include do not translate tags
+                        if (children and not element.text) or element.name in dnt_set:
+                            tag_id_map[tag_id] = element.decode()  # Serializes opening tag, children and closing tag in one go
+                            no_token_tags[element_offset].append(tag_id)
+
+                        else:
+                            # Interned as the same tags recur throughout a document, so repeats share one string
+                            tag_id_map[tag_id] = intern(get_opening_tag(element))
+                            stack.append(
+                                (element, tag_id, element_offset, iter(children))
+                            )
+
+                element = None
+                continue
 
-            # Assign each token a token id and map the tags
-            for i in range(
-                offset + len(token_buffer),
-                offset + len(token_buffer) + len(child_tokens),
-            ):
-                if i not in self.tag_map:
-                    self.tag_map[i] = []
+            parent, tag_id, start, children = stack[-1]
+            element = next(children, None)
 
-                self.tag_map[i].append(tag_id)
+            if element is not None:
+                continue
 
-            token_buffer.extend(child_tokens)
+            # All children traversed. Tokens under the tag were mapped to it as their text was tokenized
+            stack.pop()
 
-        if (
-            not token_buffer
-        ):  # All children did not return any tokens to tag to. Often occurs for self closing tags
-            if element.name in self.self_closing:
-                self.tag_id_map[tag_id] = self.tag_id_map[tag_id][:-1] + " />"
+            if (
+                start == offset + len(token_buffer)
+            ):  # All children did not return any tokens to tag to. Often occurs for self closing tags
+                if parent.name in self_closing_set:
+                    tag_id_map[tag_id] = tag_id_map[tag_id][:-1] + " />"
 
-            else:
-                self.tag_id_map[tag_id] += f"</{element.name}>"
+                else:
+                    tag_id_map[tag_id] += f"</{parent.name}>"
 
-            if offset not in self.no_token_tags:
-                self.no_token_tags[offset] = []
+                no_token_tags[start].append(tag_id)
 
-            self.no_token_tags[offset].append(tag_id)
+        self._next_tag_id = next_tag_id
 
         return token_buffer
 
@@ -197,7 +277,25 @@ class TransIns:
         if lang not in self.tokenizer.languages:
             raise TypeError(f"Tokenizer not able to handle language: {lang}")
 
-        soup = BeautifulSoup(raw, "html.parser")
+        # Bind the language's tokenizer directly, skipping the TokenizerGroup routing for every text node.
+        self._active_tokenize = self.tokenizer.language_tokenizer_map[lang].tokenize
+
+        # self_closing and dnt are public lists that users append to, so freeze them per call.
+        self._self_closing_set = frozenset(self.self_closing)
+        self._dnt_set = frozenset(self.dnt)
+
+        if not contains_markup(raw):
+            # No tags or entities, so parsing would only wrap the text in the <[document]> root.
+            tokens = self._active_tokenize(raw, lang)
+            if tokens:
+                self._next_tag_id += 1  # Tag ID 0 goes to the <[document]> root
+                for token_idx in range(len(tokens)):
+                    self.tag_map[token_idx] = [0]
+
+                self.tokens = tokens
+                return
+
+        soup = parse_markup(raw, self.parser, builder=self._get_builder())
         self.tokens = self._extract_markup(soup, lang=lang)
         del self.tag_id_map[0]  # Remove <[document]> tag inserted by BeautifulSoup
 
@@ -220,83 +318,99 @@ class TransIns:
         None
         """
         self.logger.debug("BEGIN TAG MIGRATION")
+
         if not self.tag_map:
             self.logger.warning("No tag map found! Did you run extract_markup already?")
 
-        untagged_ids = list(
+        untagged_ids = set(
             self.no_token_tags.keys()
         )  # Keep track of which tokens have no_token_tags mapped but were not migrated. Only done for tags without tokens as tag interpolation will not be able to deal with them.
 
+        # Collect target tags in sets so duplicates are dropped as they are migrated.
+        tgt_tag_map = defaultdict(
+            set, {key: set(tags) for key, tags in self.tgt_tag_map.items()}
+        )
+        tgt_no_token_tags = defaultdict(
+            set, {key: set(tags) for key, tags in self.tgt_no_token_tags.items()}
+        )
+
+        # Split on the threshold in one pass so the migration loop only sees accepted alignments.
+        accepted_alignment = []
         secondary_alignment = []
-        unmigrated_tag_ids = self.tag_id_map.keys()
+        available_sources = {}  # Dropping scores and restructuring as dict.
+        for alignment in alignments:
+            src_idx, tgt_idx, score = alignment
+            if score >= threshold:
+                accepted_alignment.append((src_idx, tgt_idx))
 
-        for src_idx, tgt_idx, score in alignments:
-            if score < threshold:
-                self.logger.debug(f"{src_idx} TO {tgt_idx} SKIPPED, BELOW THRESHOLD")
-                secondary_alignment.append((src_idx, tgt_idx, score))
-                continue
+            else:
+                secondary_alignment.append(alignment)
 
-            self.logger.debug(f"{src_idx} MAPPED TO {tgt_idx}")
-            if src_idx in self.tag_map:
-                if tgt_idx not in self.tgt_tag_map:
-                    self.tgt_tag_map[tgt_idx] = []
+            available_sources[src_idx] = tgt_idx
+
+        if secondary_alignment:
+            self.logger.debug("SKIPPED, BELOW THRESHOLD: %s", secondary_alignment)
+
+        unmigrated_tag_ids = set(self.tag_id_map.keys())
 
-                self.tgt_tag_map[tgt_idx].extend(self.tag_map[src_idx])
-                unmigrated_tag_ids = [tag for tag in unmigrated_tag_ids if tag not in self.tag_map[src_idx]]
+        # Checked once, so the per-alignment debug calls below are skipped entirely when not logging them
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+
+        for src_idx, tgt_idx in accepted_alignment:
+            if debug:
+                self.logger.debug("%s MAPPED TO %s", src_idx, tgt_idx)
+
+            if src_idx in self.tag_map:
+                tgt_tag_map[tgt_idx].update(self.tag_map[src_idx])
+                unmigrated_tag_ids.difference_update(self.tag_map[src_idx])
 
             if src_idx in self.no_token_tags:
-                self.logger.debug(f"NO-TOKEN-TAGS FOUND FOR SOURCE INDEX {src_idx}")
-                if tgt_idx not in self.tgt_no_token_tags:
-                    self.tgt_no_token_tags[tgt_idx] = []
-
-                self.tgt_no_token_tags[tgt_idx].extend(self.no_token_tags[src_idx])
-                unmigrated_tag_ids = [tag for tag in unmigrated_tag_ids if tag not in self.no_token_tags[src_idx]]
-                if src_idx in untagged_ids:
-                    untagged_ids.remove(src_idx)
+                if debug:
+                    self.logger.debug(
+                        "NO-TOKEN-TAGS FOUND FOR SOURCE INDEX %s", src_idx
+                    )
+
+                tgt_no_token_tags[tgt_idx].update(self.no_token_tags[src_idx])
+                unmigrated_tag_ids.difference_update(self.no_token_tags[src_idx])
+                untagged_ids.discard(src_idx)
         
 
-        available_sources = {src_idx: tgt_idx for src_idx, tgt_idx, _ in alignments} # Dropping scores and restructuring as dict.
+        sorted_sources = sorted(available_sources)
 
         # Migrate no_token_tags to nearest token
         if untagged_ids:
             self.logger.debug("NO-TOKEN-TAGS FAILED TO MIGRATE")
             self.logger.debug("APPROXIMATING TO NEAREST TOKEN")
 
-        for untagged_id in untagged_ids:
-            if untagged_id in unmigrated_tag_ids:
-                unmigrated_tag_ids.remove(untagged_id)
-
-            available_candidates = [
-                src_idx for src_idx in available_sources if src_idx >= untagged_id
-            ]
-            if (
-                not available_candidates
-            ):  # Check for any src indexes in alignment that are larger than or equal to untagged
-                available_candidates = [
-                    src_idx for src_idx in available_sources if src_idx < untagged_id
-                ]  # If there aren't any, check if any src indexes in alignment that are less than untagged
+        for untagged_id in sorted(untagged_ids):
+            unmigrated_tag_ids.difference_update(self.no_token_tags[untagged_id])
 
             if (
-                not available_candidates
+                not sorted_sources
             ):  # If there are no alignments for any tags more than equal to, or less than untagged (empty alignment)
-                self.tgt_no_token_tags[0] = self.no_token_tags[untagged_id]
+                tgt_no_token_tags[0] = set(self.no_token_tags[untagged_id])
                 self.logger.warning(
-                    f"UNABLE TO MAP TAG ID WITH NO TOKENS FROM SOURCE {untagged_id}. ASSIGNING TAGS TO FIRST TOKEN TO AVOID DROPPING. CHECK IF ALIGNMENT IS CORRECT!"
+                    "UNABLE TO MAP TAG ID WITH NO TOKENS FROM SOURCE %s. ASSIGNING TAGS TO FIRST TOKEN TO AVOID DROPPING. CHECK IF ALIGNMENT IS CORRECT!",
+                    untagged_id,
                 )
 
                 continue
 
+            # Closest src index in alignment that is larger than or equal to untagged. If there aren't any, closest that is less than untagged.
+            candidate_idx = bisect_left(sorted_sources, untagged_id)
             closest = (
-                min(available_candidates)
-                if min(available_candidates) >= untagged_id
-                else max(available_candidates)
+                sorted_sources[candidate_idx]
+                if candidate_idx < len(sorted_sources)
+                else sorted_sources[-1]
             )
-            tgt_idx = available_sources[closest]
-            self.logger.debug(f"ASSIGNING NO-TOKEN-TAG ID {untagged_id} TO TOKEN INDEX {tgt_idx}")
-            if closest not in self.tgt_no_token_tags:
-                self.tgt_no_token_tags[closest] = []
+            if debug:
+                self.logger.debug(
+                    "ASSIGNING NO-TOKEN-TAG ID %s TO TOKEN INDEX %s",
+                    untagged_id,
+                    available_sources[closest],
+                )
 
-            self.tgt_no_token_tags[closest].extend(self.no_token_tags[untagged_id])
+            tgt_no_token_tags[closest].update(self.no_token_tags[untagged_id])
         
         if unmigrated_tag_ids:
             if not force_migrate:
@@ -306,22 +420,40 @@ class TransIns:
                 # NOTE: UNTESTED. UNSURE OF HOW WELL THIS PERFORMS.
                 self.logger.debug("FORCE MIGRATING TAGS")
                 for src_idx, tgt_idx, _ in secondary_alignment:
-                    tags = self.tag_map[src_idx]
-                    shared = set(tags).intersection(set(unmigrated_tag_ids))
+                    shared = unmigrated_tag_ids.intersection(
+                        self.tag_map.get(src_idx, [])
+                    )
                     if not shared:
                         continue
 
-                    if tgt_idx not in self.tgt_tag_map:
-                        self.tgt_tag_map[tgt_idx] = []
+                    tgt_tag_map[tgt_idx].update(shared)
 
-                    self.tgt_tag_map[tgt_idx].extend(shared)
+        # Tag IDs are assigned in document order, so sorting keeps outer tags ahead of inner ones.
+        self.tgt_tag_map = defaultdict(
+            list, {key: sorted(tags) for key, tags in tgt_tag_map.items()}
+        )
+        self.tgt_no_token_tags = defaultdict(
+            list, {key: sorted(tags) for key, tags in tgt_no_token_tags.items()}
+        )
+
+    def _identity_migrate(self) -> None:
+        """
+        Migrate the tag map to target tokens that are identical to the source tokens, without going through alignments.
 
-        # Remove duplicates
-        for key in self.tgt_tag_map:
-            self.tgt_tag_map[key] = list(set(self.tgt_tag_map[key]))
+        Parameters
+        ----------
+        None
 
-        for key in self.tgt_no_token_tags:
-            self.tgt_no_token_tags[key] = list(set(self.tgt_no_token_tags[key]))
+        Returns
+        -------
+        None
+        """
+        self.tgt_tag_map = defaultdict(
+            list, {key: sorted(set(tags)) for key, tags in self.tag_map.items()}
+        )
+        self.tgt_no_token_tags = defaultdict(
+            list, {key: sorted(set(tags)) for key, tags in self.no_token_tags.items()}
+        )
 
     def tag_interpolate(self, target: bool = True, interpolation_gap: int = 2) -> None:
         """
@@ -348,18 +480,19 @@ class TransIns:
             self.logger.warn("NO ENTRIES IN TAG MAP! NOTHING TO INTERPOLATE!")
             return
 
-        to_interpolate = dict(OrderedDict(sorted(to_interpolate.items())))
-
         gap = 0
         gap_start = 0
         token_idx_checker = -1
 
-        for token_idx, tags in to_interpolate.items():
+        # Sweep the token indices in order, interpolating into the tag map in place
+        for token_idx in sorted(to_interpolate):
+            tags = to_interpolate[token_idx]
             if (
                 token_idx != token_idx_checker + 1
             ):  # Case should be handled when calling from reinsert_markup method. Not guaranteed when calling directly.
                 self.logger.warning(
-                    f"MISSING TOKEN INDEX {token_idx_checker + 1}! ASSIGN AN EMPTY LIST TO INTERPOLATE!"
+                    "MISSING TOKEN INDEX %s! ASSIGN AN EMPTY LIST TO INTERPOLATE!",
+                    token_idx_checker + 1,
                 )
 
             token_idx_checker = token_idx
@@ -379,26 +512,17 @@ class TransIns:
                     interpolated_tags = to_interpolate[token_idx]
 
                 else:
-                    interpolated_tags = list(
-                        set(to_interpolate[gap_start - 1]).intersection(
-                            set(to_interpolate[token_idx])
-                        )
-                    )
+                    preceding_tags = set(to_interpolate.get(gap_start - 1, ()))
+                    interpolated_tags = [tag for tag in tags if tag in preceding_tags]
 
                 for i in range(gap_start, gap_start + gap):
-                    to_interpolate[i] = interpolated_tags
+                    to_interpolate[i] = list(interpolated_tags)  # Own copy per token
 
                 gap = 0
 
         if gap and gap <= interpolation_gap and gap_start != 0:
             for i in range(gap_start, gap_start + gap):
-                to_interpolate[i] = to_interpolate[gap_start - 1]
-
-        if target:
-            self.tgt_tag_map = to_interpolate
-
-        else:
-            self.tag_map = to_interpolate
+                to_interpolate[i] = list(to_interpolate.get(gap_start - 1, ()))
 
     def reinsert_markup(
         self,
@@ -430,6 +554,12 @@ class TransIns:
         if not tokens:
             raise TypeError("No tokens to migrate to!")
 
+        if lang not in self.tokenizer.languages:
+            raise TypeError(f"Tokenizer not able to handle language: {lang}")
+
+        # Resolve the detokenizer once instead of routing through the TokenizerGroup on every flush.
+        detokenize = self.tokenizer.language_tokenizer_map[lang].detokenize
+
         if (not self.tgt_tag_map) and (target):
             self.logger.warning(
                 "TAG_MAP EMPTY FOR TARGET. DID YOU RUN MIGRATE_TAGS?"
@@ -437,8 +567,7 @@ class TransIns:
 
         if target:
             for i in range(len(tokens)):
-                if i not in self.tgt_tag_map:
-                    self.tgt_tag_map[i] = []
+                self.tgt_tag_map.setdefault(i, [])
 
         self.tag_interpolate(target=target, interpolation_gap=interpolation_gap)
 
@@ -450,30 +579,30 @@ class TransIns:
             to_reinsert = self.tag_map
             to_reinsert_no_tokens = self.no_token_tags
 
-        active_tags = []
+        # Bind attributes used per token to locals
+        tag_id_map = self.tag_id_map
+        closing_tags = {}  # Closing tags derived from the current tag_id_map, once per tag ID for this call
+
+        active_tags = []  # Open tag IDs, in the order they were opened
+        active_tags_set = set()  # Same tag IDs, for membership checks
         output_buffer = []
         _output_buffer = []  # To hold list of tokens for detokenizing
+        last_is_text = False  # Whether the last entry in output_buffer is detokenized text rather than a tag or space
 
         for token_idx, token in enumerate(tokens):
-            new_tags = to_reinsert[token_idx]
-
-            opening = [tag for tag in new_tags if tag not in active_tags]
-            closing = list(
-                reversed([tag for tag in active_tags if tag not in new_tags])
-            )
+            new_tags = to_reinsert.get(token_idx, ())
 
-            if token_idx in to_reinsert_no_tokens:
-                no_tokens = to_reinsert_no_tokens[token_idx]
+            new_tags_set = set(new_tags)
+            opening = [tag for tag in new_tags if tag not in active_tags_set]
+            closing = [tag for tag in reversed(active_tags) if tag not in new_tags_set]
 
-            else:
-                no_tokens = []
+            no_tokens = to_reinsert_no_tokens.get(token_idx, [])
 
             if opening or closing or no_tokens: # There exist some change in tags, clear the string buffer.
                 if _output_buffer:
-                    output_buffer.append(
-                        self.tokenizer.detokenize(_output_buffer, lang=lang)
-                    )
+                    output_buffer.append(detokenize(_output_buffer))
                     _output_buffer = []
+                    last_is_text = True
 
             # Information on ordering of no-token-tags and closing tags are not captured. 
             # Hard coded to insert no-token-tags after closing.
@@ -482,77 +611,76 @@ class TransIns:
                 if closing_tag_id == 0: # BeautifulSoup inserted tag
                     continue
 
-                if closing_tag_id not in self.tag_id_map:
+                if closing_tag_id not in tag_id_map:
                     self.logger.warning(
-                        f"Tag ID {closing_tag_id} NOT FOUND WHEN CLOSING! SKIPPING!"
+                        "Tag ID %s NOT FOUND WHEN CLOSING! SKIPPING!", closing_tag_id
                     )
                     continue
 
-                new_tag = "</" + self.tag_id_map[closing_tag_id].split(" ", 1)[0][1:]
-                if not new_tag.endswith(">"):
-                    new_tag += ">"
+                closing_tag = closing_tags.get(closing_tag_id)
+                if closing_tag is None:
+                    closing_tag = closing_tags[closing_tag_id] = get_closing_tag(
+                        tag_id_map[closing_tag_id]
+                    )
 
-                output_buffer.append(new_tag)
+                output_buffer.append(closing_tag)
                 # TODO: Handle whitespace insertion around tags
                 # Added to avoid tokens occuring immediately after tag from sticking to previous token.
                 # Not necessarily true for all languages, but much more damaging to readability of outcome if its missing when it needs to be there.
                 output_buffer.append(" ")
+                last_is_text = False
 
             for opening_tag_id in opening:
                 if opening_tag_id == 0:
                     continue
 
-                if opening_tag_id not in self.tag_id_map:
+                if opening_tag_id not in tag_id_map:
                     self.logger.warning(
-                        f"Tag ID {opening_tag_id} NOT FOUND WHEN OPENING! SKIPPING!"
+                        "Tag ID %s NOT FOUND WHEN OPENING! SKIPPING!", opening_tag_id
                     )
                     continue
-                active_tags.append(opening_tag_id)
 
-                new_tag = self.tag_id_map[opening_tag_id]
-                if (
-                    output_buffer
-                    and output_buffer[-1] != " "
-                    and not is_tag(output_buffer[-1])
-                ):
+                new_tag = tag_id_map[opening_tag_id]
+                if last_is_text:
                     output_buffer.append(" ")
 
-                # Handle order of insertion of no-token-tags by tag ID.
-                _no_tokens = [tag_id for tag_id in no_tokens if tag_id < opening_tag_id]
-                for tag_id in _no_tokens:
-                    _new_tag = self.tag_id_map[tag_id]
-                    output_buffer.append(_new_tag)
-                
-                no_tokens = [tag_id for tag_id in no_tokens if tag_id not in _no_tokens]
+                # Handle order of insertion of no-token-tags by tag ID, in a single pass over no_tokens.
+                _no_tokens = []  # No-token-tags still to be inserted
+                for tag_id in no_tokens:
+                    if tag_id < opening_tag_id:
+                        output_buffer.append(tag_id_map[tag_id])
+
+                    else:
+                        _no_tokens.append(tag_id)
+
+                no_tokens = _no_tokens
 
                 output_buffer.append(new_tag)
+                last_is_text = False
 
             for tag_id in no_tokens:
-                if tag_id not in self.tag_id_map:
+                if tag_id not in tag_id_map:
                     self.logger.warning(
-                        f"Tag ID {tag_id} NOT FOUND WHEN SELF CLOSING! SKIPPING!"
+                        "Tag ID %s NOT FOUND WHEN SELF CLOSING! SKIPPING!", tag_id
                     )
                     continue
 
-                new_tag = self.tag_id_map[tag_id]
+                new_tag = tag_id_map[tag_id]
 
-                if (
-                    output_buffer
-                    and output_buffer[-1] != " "
-                    and not is_tag(output_buffer[-1])
-                ):
+                if last_is_text:
                     output_buffer.append(" ")
 
                 output_buffer.append(new_tag)
+                last_is_text = False
 
             _output_buffer.append(token)
 
-            active_tags = [tag for tag in active_tags if tag not in closing]
             active_tags.extend(opening)
-            active_tags = list(set(active_tags))
+            active_tags_set.difference_update(closing)
+            active_tags_set.update(opening)
 
         if _output_buffer:
-            output_buffer.append(self.tokenizer.detokenize(_output_buffer, lang=lang))
+            output_buffer.append(detokenize(_output_buffer))
 
         # Close buffers.
         if active_tags:
@@ -560,22 +688,22 @@ class TransIns:
                 if tag_id == 0:
                     continue
 
-                if tag_id not in self.tag_id_map:
+                if tag_id not in tag_id_map:
                     self.logger.warning(
-                        f"Tag ID {tag_id} NOT FOUND WHEN CLOSING! SKIPPING!"
+                        "Tag ID %s NOT FOUND WHEN CLOSING! SKIPPING!", tag_id
                     )
                     continue
 
-                new_tag = "</" + self.tag_id_map[tag_id].split(" ", 1)[0][1:]
-                if not new_tag.endswith(">"):
-                    new_tag += ">"
+                closing_tag = closing_tags.get(tag_id)
+                if closing_tag is None:
+                    closing_tag = get_closing_tag(tag_id_map[tag_id])
 
-                output_buffer.append(new_tag)
+                output_buffer.append(closing_tag)
 
         if to_reinsert_no_tokens and max(to_reinsert_no_tokens.keys()) == len(tokens):
             output_buffer.extend(
                 [
-                    self.tag_id_map[tag_id]
+                    tag_id_map[tag_id]
                     for tag_id in to_reinsert_no_tokens[len(tokens)]
                 ]
             )
@@ -607,10 +735,9 @@ class TransIns:
         logging.basicConfig(level=logging.DEBUG)
         self.extract_markup(text)
         target_tokens = self.tokens.copy()
-        alignments = [(i, i, 1) for i in range(len(target_tokens))]
-        self.migrate_tags(alignments)
+        self._identity_migrate()  # Target tokens are the source tokens, so every tag stays where it is
         output = self.reinsert_markup(target_tokens)
-        tree_edit_dist = compare_markup(text, output)
+        tree_edit_dist = compare_markup(text, output, parser=self.parser)
 
         log_string_source = ["Source info"]
         log_string_target = ["Target info"]
@@ -620,12 +747,12 @@ class TransIns:
             log_string_target.append(f"Target Tokens: {target_tokens}")
 
         if "tag_map" in to_log:
-            log_string_source.append(f"Tag Map: {self.tag_map}")
-            log_string_target.append(f"Target Tag Map: {self.tgt_tag_map}")
+            log_string_source.append(f"Tag Map: {dict(self.tag_map)}")
+            log_string_target.append(f"Target Tag Map: {dict(self.tgt_tag_map)}")
 
         if "no_token_tags" in to_log:
-            log_string_source.append(f"No Token Tags: {self.no_token_tags}")
-            log_string_target.append(f"Target No Token Tags: {self.tgt_no_token_tags}")
+            log_string_source.append(f"No Token Tags: {dict(self.no_token_tags)}")
+            log_string_target.append(f"Target No Token Tags: {dict(self.tgt_no_token_tags)}")
 
         log_string = []
 
@@ -662,16 +789,17 @@ class TransIns:
         None
         """
         self.tag_id_map = {}
+        self._next_tag_id = 0
 
         # Source version
-        self.tag_map = {}
+        self.tag_map = defaultdict(list)
         self.tokens = []
-        self.no_token_tags = {}
+        self.no_token_tags = defaultdict(list)
 
         # Target version
-        self.tgt_tag_map = {}
+        self.tgt_tag_map = defaultdict(list)
         self.tgt_tokens = []
-        self.tgt_no_token_tags = {}
+        self.tgt_no_token_tags = defaultdict(list)
 
 
 if __name__ == "__main__":
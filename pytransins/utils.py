@@ -1,9 +1,112 @@
 """Set of utility functions to be used with the transins library."""
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Tuple
+
 from bs4 import BeautifulSoup
+from bs4.builder import TreeBuilder
 from bs4.element import Tag
 from zss import Node, simple_distance
 
 
+# Tags that parsers other than html.parser insert around fragments.
+_IMPLIED_TAGS = ("html", "head", "body")
+_IMPLIED_TAG_RE = re.compile(r"<(html|head|body)[\s/>]", re.IGNORECASE)
+
+
+class _ImpliedTagScanner(HTMLParser):
+    """Collect the html, head and body start tags in markup. Matches in comments, CDATA, script and style content or attribute values are not start tags, so are skipped."""
+
+    def __init__(self) -> None:
+        super(_ImpliedTagScanner, self).__init__(convert_charrefs=False)
+        self.present = set()
+
+    def handle_starttag(self, tag, attrs) -> None:
+        """Record the start tag if it is an html, head or body tag."""
+        if tag in _IMPLIED_TAGS:
+            self.present.add(tag)
+
+
+def _get_present_implied_tags(markup: str) -> set:
+    """Get the names of the html, head and body tags that the markup itself contains."""
+    if not _IMPLIED_TAG_RE.search(markup):  # Quick check, no such tag can be present
+        return set()
+
+    scanner = _ImpliedTagScanner()
+    scanner.feed(markup)
+    scanner.close()
+    return scanner.present
+
+
+def parse_markup(
+    markup: str, parser: str = "html.parser", builder: TreeBuilder = None
+) -> BeautifulSoup:
+    """
+    Parse markup with BeautifulSoup, removing any html, head and body tags the parser inserted that are not in the markup itself.
+
+    Parameters
+    ----------
+    markup : str
+        Markup document as a string to be parsed
+    parser : str (default html.parser)
+        BeautifulSoup parser to use, e.g. "lxml"
+    builder : TreeBuilder (default None)
+        Tree builder instance for the parser, to reuse across calls instead of creating one per call
+
+
+    Returns
+    -------
+    soup : BeautifulSoup
+        Parsed document tree, with the same structure html.parser would give.
+    """
+    soup = BeautifulSoup(markup, parser, builder=builder)
+    if parser == "html.parser":  # Never inserts tags
+        return soup
+
+    present = _get_present_implied_tags(markup)
+    for name in _IMPLIED_TAGS:
+        if name in present:
+            continue
+
+        implied = soup.find(name)
+        if implied is not None:
+            implied.unwrap()
+
+    return soup
+
+
+def contains_markup(markup: str) -> bool:
+    """
+    Check if a string may contain tags, comments or entities that a parser would need to handle.
+
+    A "<" that cannot start a tag (e.g. "1 < 2") is treated as text, the same way html.parser treats it.
+
+    Parameters
+    ----------
+    markup : str
+        Markup document as a string to check
+
+
+    Returns
+    -------
+    output : bool
+        False if the string is plain text that parsing would leave unchanged.
+    """
+    if "&" in markup:
+        return True
+
+    idx = markup.find("<")
+    while idx != -1:
+        next_char = markup[idx + 1 : idx + 2]
+        if not next_char or next_char.isalpha() or next_char in "/!?":
+            return True
+
+        idx = markup.find("<", idx + 1)
+
+    return False
+
+
 def is_tag(element: str) -> bool:
     """Check if string provided is a markup tag."""
     return element.startswith("<") and element.endswith(">")
@@ -24,25 +127,48 @@ def get_opening_tag(element: Tag) -> str:
     output : str
         Opening tag with attributes of the element provided.
     """
-    raw_attrs = {
-        k: v if not isinstance(v, list) else " ".join(v)
-        for k, v in element.attrs.items()
-    }
-    attrs = " ".join((f'{k}="{v}"' for k, v in raw_attrs.items()))
-    if attrs:
-        return f"<{element.name} {attrs}>"
-    else:
+    if not element.attrs:  # Most tags have no attributes, skip building the attribute string
         return f"<{element.name}>"
 
+    attrs = " ".join(
+        f'{k}="{" ".join(v) if isinstance(v, list) else v}"'
+        for k, v in element.attrs.items()
+    )
+    return f"<{element.name} {attrs}>"
+
+
+def get_closing_tag(opening_tag: str) -> str:
+    """
+    Derive the closing tag from the string representation of an opening tag.
+
+    Parameters
+    ----------
+    opening_tag : str
+        Opening tag, e.g. as returned by get_opening_tag
+
+
+    Returns
+    -------
+    output : str
+        Closing tag for the opening tag provided.
+    """
+    output = "</" + opening_tag.split(" ", 1)[0][1:]
+    if not output.endswith(">"):
+        output += ">"
+
+    return output
+
 
 def _convert_to_nodes(element: Tag):
     """
-    Recursive conversion of Document Tree into a graph understood by zss library.
+    Conversion of Document Tree into a graph understood by zss library.
+
+    Uses an explicit stack rather than recursion, so documents nested deeper than the recursion limit can be converted.
 
     Parameters
     ----------
     element : Tag
-        BeautifulSoup Tag element to recurse down
+        BeautifulSoup Tag element to traverse down
 
 
     Returns
@@ -56,14 +182,32 @@ def _convert_to_nodes(element: Tag):
     except Exception:  # Unable to get children. Can happen for some tags like script.
         return Node("NULL", [])
 
-    sub_doc = []
-    for child in children:
-        sub_doc.append(_convert_to_nodes(child))
+    root = Node(get_opening_tag(element), [])
+
+    # Nodes whose children are still being converted, as (node, iterator over remaining children)
+    stack = [(root, iter(children))]
+    while stack:
+        node, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            continue
+
+        try:
+            grandchildren = child.contents
+
+        except Exception:  # Unable to get children. Can happen for some tags like script.
+            node.children.append(Node("NULL", []))
+            continue
 
-    return Node(get_opening_tag(element), sub_doc)
+        child_node = Node(get_opening_tag(child), [])
+        node.children.append(child_node)
+        stack.append((child_node, iter(grandchildren)))
 
+    return root
 
-def convert_to_nodes(markup: str) -> Node:
+
+def convert_to_nodes(markup: str, parser: str = "html.parser") -> Node:
     """
     Convert markup document tree into a graph understood by zss library.
 
@@ -71,6 +215,8 @@ def convert_to_nodes(markup: str) -> Node:
     ----------
     markup : str
         markup document as a string to be converted
+    parser : str (default html.parser)
+        BeautifulSoup parser to use, e.g. "lxml" for the faster C-backed parser
 
 
     Returns
@@ -78,29 +224,82 @@ def convert_to_nodes(markup: str) -> Node:
     tree : Node
         zss Node object that stores the entire tree.
     """
-    soup = BeautifulSoup(markup, "html.parser")
+    soup = parse_markup(markup, parser)
     tree = _convert_to_nodes(soup)
     return tree
 
 
-def compare_markup(src: str, tgt: str) -> int:
+def _tree_key(tree: Node) -> tuple:
+    """Flatten a zss tree into its pre-order (label, number of children) pairs, without recursing. Trees are identical exactly when their keys are equal."""
+    key = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        key.append((node.label, len(node.children)))
+        stack.extend(reversed(node.children))
+
+    return tuple(key)
+
+
+@lru_cache(maxsize=128)
+def _get_markup_tree(markup: str, parser: str) -> Tuple[tuple, Node]:
+    """Convert markup to a zss tree and its _tree_key for compare_markup. Cached, as the same source is often compared against many candidates. The tree is only used internally, so is never modified."""
+    tree = convert_to_nodes(markup, parser)
+    return _tree_key(tree), tree
+
+
+def compare_markup(
+    src: str, tgt: str, max_distance: int = None, parser: str = "html.parser"
+) -> int:
     """
     Compute the tree edit distance between 2 markup documents.
 
+    The trees of the last 128 documents compared are cached, as the same source is often compared against many candidates. Call clear_compare_markup_cache() to free them.
+
     Parameters
     ----------
     src : str
         Source markup document
     tgt : str
         Target markup document
+    max_distance : int (default None)
+        If set, skip the ZSS algorithm when the difference in node counts alone already exceeds it, returning that difference instead. As every unmatched node costs an insertion or deletion, this is a lower bound of the distance.
+    parser : str (default html.parser)
+        BeautifulSoup parser to use, e.g. "lxml" for the faster C-backed parser
 
 
     Returns
     -------
     score : int
-        Tree edit distance as given by the ZSS algorithm
+        Tree edit distance as given by the ZSS algorithm, or a lower bound larger than max_distance
     """
-    src_tree = convert_to_nodes(src)
-    tgt_tree = convert_to_nodes(tgt)
+    if src == tgt:  # Identical documents, no need to build and compare trees
+        return 0
+
+    src_key, src_tree = _get_markup_tree(src, parser)
+    tgt_key, tgt_tree = _get_markup_tree(tgt, parser)
+    if src_key == tgt_key:  # Same structure, e.g. only the text differs
+        return 0
+
+    if max_distance is not None:
+        size_gap = abs(len(src_key) - len(tgt_key))
+        if size_gap > max_distance:
+            return size_gap
+
     score = simple_distance(src_tree, tgt_tree)
     return score
+
+
+def clear_compare_markup_cache() -> None:
+    """
+    Free the document trees cached by compare_markup.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    """
+    _get_markup_tree.cache_clear()
@@ -1,5 +1,5 @@
 """Test file for tokenizers."""
-from pytransins.tokenizer import Tokenizer, TokenizerGroup, check_lang
+from pytransins.tokenizer import MosesTokenizer, Tokenizer, TokenizerGroup, check_lang
 
 
 class MockTokenizer(Tokenizer):
@@ -76,6 +76,16 @@ def test_tokenizer_group():
     assert tokenizer_group.languages == ["en", "zh"]
 
 
+def test_tokenizer_group_language_not_supported():
+    """Test for TypeError. Should raise if TokenizerGroup has no tokenizer for the language."""
+    try:
+        tokenizer_group.tokenize("this is a test", "id")
+        raise AssertionError
+
+    except TypeError as exc:
+        assert str(exc) == "Language id not supported!"
+
+
 def test_tokenizer_group_faulty():
     """Test for TokenizerGroup faulty add_tokenizer input."""
     mock_tokenizer_faulty = Tokenizer()
@@ -89,3 +99,30 @@ def test_tokenizer_group_faulty():
     tokenizer_group.add_tokenizer(mock_tokenizer_faulty)
 
     assert "some other language" in tokenizer_group.languages
+
+
+def test_moses_tokenizer_shared():
+    """Test that MosesTokenizer instances reuse the same underlying sacremoses objects."""
+    moses_a = MosesTokenizer()
+    moses_b = MosesTokenizer()
+
+    assert moses_a.tokenizer is moses_b.tokenizer
+    assert moses_a.detokenizer is moses_b.detokenizer
+    assert moses_a.tokenize("this is a test", "en") == ["this", "is", "a", "test"]
+
+
+def test_moses_tokenizer_cached():
+    """Test that repeated tokenize calls are served from the cache without sharing the returned list."""
+    moses_tokenizer = MosesTokenizer()
+
+    res = moses_tokenizer.tokenize("this is a cached test", "en")
+    res.append("mutated")
+
+    assert moses_tokenizer.tokenize("this is a cached test", "en") == [
+        "this",
+        "is",
+        "a",
+        "cached",
+        "test",
+    ]
+    assert moses_tokenizer._tokenize_cached.cache_info().hits == 1
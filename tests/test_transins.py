@@ -1,4 +1,10 @@
 """Test file for transins."""
+import sys
+from collections import defaultdict
+
+import pytest
+
+import pytransins.transins as transins_module
 from pytransins.tokenizer import MosesTokenizer, Tokenizer
 from pytransins.transins import TransIns
 
@@ -23,6 +29,54 @@ def test_transins_invalid_tokenizer():
         assert True
 
 
+def test_transins_parser_fallback():
+    """Test for falling back to html.parser when the requested parser is not available."""
+    assert TransIns(parser="not-a-parser").parser == "html.parser"
+
+
+def test_transins_migrate_debug_logging(caplog):
+    """Test that per-alignment debug messages are formatted when debug logging is on."""
+    debug_transins = TransIns()
+    debug_transins.tag_map = {0: [1], 1: [1]}
+    debug_transins.no_token_tags = {1: [2]}
+
+    with caplog.at_level("DEBUG", logger="pytransins"):
+        debug_transins.migrate_tags([(0, 1, 1), (1, 0, 1)])
+
+    assert "0 MAPPED TO 1" in caplog.messages
+    assert "NO-TOKEN-TAGS FOUND FOR SOURCE INDEX 1" in caplog.messages
+
+
+def test_transins_extract_markup_lxml():
+    """Test that extracting with lxml gives the same result as html.parser."""
+    pytest.importorskip("lxml")
+    lxml_transins = TransIns(parser="lxml")
+    test_input = "<h>this is <br> a <img src='http://localhost' /> test</h>"
+
+    lxml_transins.extract_markup(test_input)
+
+    assert lxml_transins.tokens == ["this", "is", "a", "test"]
+    assert lxml_transins.tag_map == {0: [1, 0], 1: [1, 0], 2: [1, 0], 3: [1, 0]}
+    assert lxml_transins.no_token_tags == {2: [2], 3: [3]}
+    assert lxml_transins.tag_id_map == {
+        1: "<h>",
+        2: "<br />",
+        3: '<img src="http://localhost" />',
+    }
+
+
+def test_transins_extract_markup_lxml_commented_wrapper():
+    """Test that a body tag inside a comment does not keep the body tag inserted by lxml."""
+    pytest.importorskip("lxml")
+    lxml_transins = TransIns(parser="lxml")
+    test_input = "<!-- <body> --><p>this is a test</p>"
+
+    lxml_transins.extract_markup(test_input)
+
+    assert lxml_transins.tag_id_map == {1: "<!--  <body>  -->", 2: "<p>"}
+    assert lxml_transins.tag_map == {0: [2, 0], 1: [2, 0], 2: [2, 0], 3: [2, 0]}
+
+
 transins = TransIns(MosesTokenizer())  # Use this for rest of tests.
 
 
@@ -39,6 +93,104 @@ def test_transins_extract_markup_simple():
     assert transins.tag_id_map == {1: "<h>"}
 
 
+def test_transins_extract_markup_independent_tag_lists():
+    """Test that changing the tags of one token leaves the tokens next to it unchanged."""
+    transins.reset()
+    test_input = "<h>this is <b>a</b> test</h>"
+
+    transins.extract_markup(test_input)
+    transins.tag_map[0].append(5)
+    transins.tag_map[3].remove(1)
+
+    assert transins.tag_map == {0: [1, 0, 5], 1: [1, 0], 2: [2, 1, 0], 3: [0]}
+
+    transins.reset()
+    transins.extract_markup("this is a test")
+    transins.tag_map[0].append(5)
+
+    assert transins.tag_map == {0: [0, 5], 1: [0], 2: [0], 3: [0]}
+
+
+def test_transins_extract_markup_interned_tags():
+    """Test that repeated tags share the same string."""
+    transins.reset()
+    test_input = "<h><b>this</b> is <b>a</b> test</h>"
+
+    transins.extract_markup(test_input)
+
+    assert transins.tag_id_map == {1: "<h>", 2: "<b>", 3: "<b>"}
+    assert transins.tag_id_map[2] is transins.tag_id_map[3]
+
+
+def test_transins_extract_markup_plain_text(mocker):
+    """Test that plain text without markup skips parsing but is mapped the same way."""
+    transins.reset()
+    mock_parse = mocker.patch("pytransins.transins.parse_markup")
+
+    transins.extract_markup("this is a test")
+
+    mock_parse.assert_not_called()
+    assert transins.tokens == ["this", "is", "a", "test"]
+    assert transins.tag_map == {0: [0], 1: [0], 2: [0], 3: [0]}
+    assert transins.no_token_tags == {}
+    assert transins.tag_id_map == {}
+
+
+def test_transins_extract_markup_plain_text_less_than(mocker):
+    """Test that plain text with a "<" that cannot start a tag skips parsing."""
+    transins.reset()
+    mock_parse = mocker.patch("pytransins.transins.parse_markup")
+
+    transins.extract_markup("1 < 2")
+
+    mock_parse.assert_not_called()
+    assert transins.tokens == ["1", "&lt;", "2"]
+    assert transins.tag_map == {0: [0], 1: [0], 2: [0]}
+
+
+def test_transins_extract_markup_builder_reused(mocker):
+    """Test that the same tree builder is used for every parse."""
+    spy = mocker.spy(transins_module, "parse_markup")
+
+    for _ in range(2):
+        transins.reset()
+        transins.extract_markup("<h>this is a test</h>")
+
+    assert spy.call_count == 2
+    assert all(
+        call.kwargs["builder"] is transins._builder for call in spy.call_args_list
+    )
+    assert transins.tag_id_map == {1: "<h>"}
+
+
+def test_transins_extract_markup_parser_changed():
+    """Test that changing the parser attribute after initialization changes the parser used."""
+    pytest.importorskip("lxml")
+    parser_transins = TransIns(parser="lxml")
+    lxml_builder = parser_transins._builder
+    test_input = "<h>this is a test</h>"
+
+    parser_transins.parser = "html.parser"
+    parser_transins.extract_markup(test_input)
+
+    assert parser_transins._builder is not lxml_builder
+    assert parser_transins.tag_id_map == {1: "<h>"}
+
+    parser_transins.reset()
+    parser_transins.parser = "lxml"
+    parser_transins.extract_markup(test_input)
+
+    assert parser_transins._builder is not lxml_builder
+    assert parser_transins.tag_id_map == {1: "<h>"}
+
+    parser_transins.reset()
+    parser_transins.parser = "not-a-parser"
+    parser_transins.extract_markup(test_input)
+
+    assert parser_transins.parser == "html.parser"
+    assert parser_transins.tag_id_map == {1: "<h>"}
+
+
 def test_transins_extract_markup_self_closing():
     """Test for handling of self closing tags."""
     transins.reset()
@@ -88,6 +240,83 @@ def test_transins_extract_markup_dnt():
     transins.dnt.remove("dnt")
 
 
+def test_transins_extract_markup_dnt_escaped():
+    """Test that Do Not Translate content keeps its entities escaped."""
+    transins.reset()
+    transins.dnt.append("dnt")
+    test_input = "<h>this is a <dnt>this &amp; that</dnt> test</h>"
+
+    transins.extract_markup(test_input)
+
+    assert transins.tag_id_map == {1: "<h>", 2: "<dnt>this &amp; that</dnt>"}
+
+    transins.dnt.remove("dnt")
+
+
+def test_transins_extract_markup_doctype():
+    """Test that a doctype is not tokenized as text."""
+    transins.reset()
+    test_input = "<!DOCTYPE html><h>this is a test</h>"
+
+    transins.extract_markup(test_input)
+
+    assert transins.tokens == ["this", "is", "a", "test"]
+    assert transins.tag_map == {0: [1, 0], 1: [1, 0], 2: [1, 0], 3: [1, 0]}
+    assert transins.tag_id_map == {1: "<h>"}
+
+
+def test_transins_extract_markup_deep():
+    """Test for documents nested deeper than the recursion limit."""
+    transins.reset()
+    depth = sys.getrecursionlimit() + 100
+    test_input = "<b>" * depth + "deep" + "</b>" * depth
+
+    transins.extract_markup(test_input)
+
+    assert transins.tokens == ["deep"]
+    assert transins.tag_map[0] == list(range(depth, -1, -1))
+
+
+def test_transins_extract_markup_lang(mocker):
+    """Test that the requested language is used for text nested inside tags."""
+    transins.reset()
+    spy = mocker.spy(transins.tokenizer.language_tokenizer_map["es"], "tokenize")
+
+    transins.extract_markup("<h>esto es <b>una</b> prueba</h>", lang="es")
+
+    assert transins.tokens == ["esto", "es", "una", "prueba"]
+    assert spy.call_count == 3
+    assert all(call.args[1] == "es" for call in spy.call_args_list)
+
+
+def test_transins_extract_markup_text_run():
+    """Test that adjacent text siblings are tokenized separately but mapped to the same tags."""
+    transins.reset()
+
+    transins.extract_markup("<p>Hello </x>world</p>")
+
+    assert transins.tokens == ["Hello", "world"]
+    assert transins.tag_map == {0: [1, 0], 1: [1, 0]}
+
+    # No whitespace at the boundary, the tokens must not be joined
+    transins.reset()
+    transins.extract_markup("<p>a</br>b</p>")
+
+    assert transins.tokens == ["a", "b"]
+    assert transins.tag_map == {0: [1, 0], 1: [1, 0]}
+
+    transins.reset()
+    transins.extract_markup("<p>foo</x>bar</p>")
+
+    assert transins.tokens == ["foo", "bar"]
+
+    transins.reset()
+    transins.extract_markup("<p>Go to test.</x>More</p>")
+
+    assert transins.tokens == ["Go", "to", "test", ".", "More"]
+    assert transins.tag_map == {i: [1, 0] for i in range(5)}
+
+
 def test_transins_migrate_simple():
     """Test for simple tag migration."""
     transins.reset()
@@ -104,6 +333,40 @@ def test_transins_migrate_simple():
     assert transins.tgt_no_token_tags == {2: [3]}
 
 
+def test_transins_migrate_identity():
+    """Test that the identity migration used by test matches migrating with identity alignments, except for tags after the last token."""
+    for test_input in [
+        "<h>this is <b>a</b> test</h>",
+        "<p>this <br> is <i>a <b>nested</b></i> test</p>",
+        "<p>this is <script>console.log('DO NOT TRANSLATE');</script>markup</p>",
+    ]:
+        transins.reset()
+        transins.extract_markup(test_input)
+
+        transins.migrate_tags([(i, i, 1) for i in range(len(transins.tokens))])
+        expected_tag_map = transins.tgt_tag_map
+        expected_no_token_tags = transins.tgt_no_token_tags
+
+        transins._identity_migrate()
+
+        assert transins.tgt_tag_map == expected_tag_map
+        assert transins.tgt_no_token_tags == expected_no_token_tags
+
+    # Tags after the last token have no aligned source index. migrate_tags snaps them to the last token, the identity migration keeps them at the end.
+    transins.reset()
+    transins.extract_markup("<h>this is a test</h><br>")
+
+    transins.migrate_tags([(i, i, 1) for i in range(len(transins.tokens))])
+    expected_tag_map = transins.tgt_tag_map
+
+    assert transins.tgt_no_token_tags == {3: [2]}
+
+    transins._identity_migrate()
+
+    assert transins.tgt_tag_map == expected_tag_map
+    assert transins.tgt_no_token_tags == {4: [2]}
+
+
 def test_transins_migrate_threshold():
     """Test for migration thresholds."""
     transins.reset()
@@ -140,6 +403,22 @@ def test_transins_migrate_threshold():
     assert transins.tgt_no_token_tags == {2: [3]}
 
 
+def test_transins_migrate_force():
+    """Test for force migrating tags whose alignments are below threshold."""
+    transins.reset()
+
+    transins.tag_id_map = {1: "<h>", 2: "<b>", 3: "<br />"}
+    transins.tag_map = {0: [1], 1: [1], 2: [1, 2]}
+    transins.no_token_tags = {2: [3]}
+
+    alignment = [(0, 0, 1), (1, 1, 1), (2, 2, 0.1)]
+
+    transins.migrate_tags(alignment, force_migrate=True)
+
+    assert transins.tgt_tag_map == {0: [1], 1: [1], 2: [2]}
+    assert transins.tgt_no_token_tags == {2: [3]}
+
+
 def test_transins_migrate_dropped_no_tokens():
     """Test for migrating dropped no token tags."""
     transins.reset()
@@ -212,6 +491,28 @@ def test_transins_tag_interpolate():
     assert transins.tgt_tag_map == {0: [1], 1: [1], 2: [1], 3: [1, 2]}
 
 
+def test_transins_tag_interpolate_order():
+    """Test that interpolated tags keep the order of the tags after the gap."""
+    transins.reset()
+    transins.tag_map = {0: [3, 2, 1], 1: [], 2: [5, 2, 1]}
+
+    transins.tag_interpolate(target=False)
+
+    assert transins.tag_map == {0: [3, 2, 1], 1: [2, 1], 2: [5, 2, 1]}
+
+
+def test_transins_tag_interpolate_independent_tag_lists():
+    """Test that interpolated tokens do not share tag lists."""
+    transins.reset()
+    transins.tgt_tag_map = {0: [1], 1: [], 2: [], 3: [1], 4: [], 5: []}
+
+    transins.tag_interpolate()
+    transins.tgt_tag_map[1].append(2)
+    transins.tgt_tag_map[4].append(2)
+
+    assert transins.tgt_tag_map == {0: [1], 1: [1, 2], 2: [1], 3: [1], 4: [1, 2], 5: [1]}
+
+
 def test_transins_tag_interpolate_start_end():
     """Test for interpolating gaps at start and end."""
     # If gap at the start, assign tags at the end
@@ -346,6 +647,86 @@ def test_transins_reinsert_source():
     )
 
 
+def test_transins_reinsert_source_untagged_tokens():
+    """Test that reinserting into source does not add entries for untagged tokens to tag_map."""
+    transins.reset()
+
+    transins.tag_id_map = {1: "<h>"}
+    transins.tag_map = defaultdict(list, {0: [1], 2: [1]})
+    transins.no_token_tags = defaultdict(list)
+    tokens = ["token0", "token1", "token2", "token3"]
+
+    output = transins.reinsert_markup(tokens, target=False, interpolation_gap=0)
+
+    assert output == "<h>token0</h> token1 <h>token2</h> token3"
+    assert transins.tag_map == {0: [1], 2: [1]}
+    assert transins.no_token_tags == {}
+
+
+def test_transins_reinsert_closing_order():
+    """Test that tags are closed in the reverse order they were opened."""
+    transins.reset()
+
+    transins.tag_interpolate = (
+        lambda target, interpolation_gap: None
+    )  # Do not test tag interpolation during reinsertion test.
+
+    transins.tag_id_map = {1: "<h>", 2: "<b>", 3: "<i>"}
+    transins.tgt_tag_map = {0: [1, 3], 1: [1, 2, 3], 2: [1]}
+    tgt_tokens = ["token0", "token1", "token2"]
+
+    output = transins.reinsert_markup(tgt_tokens)
+
+    assert output == "<h><i>token0 <b>token1</b> </i> token2</h>"
+
+
+def test_transins_reinsert_reassigned_tags():
+    """Test that closing tags follow tag_id_map when it is reassigned after extraction."""
+    transins.reset()
+
+    transins.tag_interpolate = (
+        lambda target, interpolation_gap: None
+    )  # Do not test tag interpolation during reinsertion test.
+
+    transins.extract_markup("<h>this is <b>a</b> test</h>")
+    transins.tag_id_map = {1: "<p>", 2: "<b class='x'>"}
+    transins.tgt_tag_map = {0: [1], 1: [1, 2]}
+
+    output = transins.reinsert_markup(["token0", "token1"])
+
+    assert output == "<p>token0 <b class='x'>token1</b></p>"
+
+
+def test_transins_reinsert_closing_tags_derived_once(mocker):
+    """Test that the closing tag of a tag ID is only derived once per reinsertion."""
+    transins.reset()
+    spy = mocker.spy(transins_module, "get_closing_tag")
+
+    transins.tag_interpolate = (
+        lambda target, interpolation_gap: None
+    )  # Do not test tag interpolation during reinsertion test.
+
+    transins.tag_id_map = {1: "<b>"}
+    transins.tgt_tag_map = {0: [1], 1: [], 2: [1], 3: []}
+
+    output = transins.reinsert_markup(["token0", "token1", "token2", "token3"])
+
+    assert output == "<b>token0</b> token1 <b>token2</b> token3"
+    assert spy.call_count == 1
+
+
+def test_transins_reinsert_language_not_supported():
+    """Test for TypeError. Should raise if reinserting with a language the tokenizer cannot detokenize."""
+    transins.reset()
+
+    try:
+        transins.reinsert_markup(["token0"], lang="id")
+        raise AssertionError
+
+    except TypeError as exc:
+        assert str(exc) == "Tokenizer not able to handle language: id"
+
+
 def test_transins_test(mocker):
     """Test for transins test extract then reinsert."""
     mocker.patch("pytransins.transins.compare_markup", return_value=1)
@@ -355,3 +736,16 @@ def test_transins_test(mocker):
     output = transins.test("<h>this is a test</h>")
 
     assert output == "<h>this is a test</h>"
+
+
+def test_transins_test_trailing_tags(mocker):
+    """Test that tags after the last token stay at the end when testing."""
+    mocker.patch("pytransins.transins.compare_markup", return_value=0)
+    spy = mocker.spy(transins, "migrate_tags")
+
+    transins.reset()
+
+    output = transins.test("<h>this is a test</h><br>")
+
+    assert output == "<h>this is a test</h><br />"
+    spy.assert_not_called()
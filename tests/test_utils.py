@@ -1,7 +1,26 @@
 """Test for utils."""
+import sys
+
+import pytest
+from bs4 import BeautifulSoup
 from zss import Node
 
-from pytransins.utils import compare_markup, convert_to_nodes
+from pytransins import utils
+from pytransins.utils import (
+    clear_compare_markup_cache,
+    compare_markup,
+    contains_markup,
+    convert_to_nodes,
+    get_closing_tag,
+    get_opening_tag,
+    parse_markup,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_markup_tree_cache():
+    """Clear the trees cached by compare_markup, so mocked conversions do not leak between tests."""
+    clear_compare_markup_cache()
 
 
 def test_convert_to_nodes():
@@ -15,6 +34,27 @@ def test_convert_to_nodes():
     assert str(result) == str(expected_graph)
 
 
+def test_convert_to_nodes_lxml():
+    """Test that converting with lxml gives the same tree as html.parser."""
+    pytest.importorskip("lxml")
+    test_input = "<h>this is <b>a</b> test"
+
+    result = convert_to_nodes(test_input, "lxml")
+
+    assert str(result) == str(convert_to_nodes(test_input))
+
+
+def test_convert_to_nodes_not_shared():
+    """Test that converting the same markup again gives a new tree."""
+    test_input = "<h>this is <b>a</b> test</h>"
+
+    result = convert_to_nodes(test_input)
+    result.children.append(Node("<p>"))
+
+    assert convert_to_nodes(test_input) is not result
+    assert str(convert_to_nodes(test_input)) != str(result)
+
+
 def test_convert_to_nodes_faulty():
     """Test for faulty markup string."""
     test_input = "<h>some text"
@@ -25,6 +65,20 @@ def test_convert_to_nodes_faulty():
     assert result == expected_graph
 
 
+def test_convert_to_nodes_deep():
+    """Test for documents nested deeper than the recursion limit."""
+    depth = sys.getrecursionlimit() + 100
+    test_input = "<b>" * depth + "deep" + "</b>" * depth
+
+    node = convert_to_nodes(test_input)
+
+    for _ in range(depth):
+        assert node.children[0].label == "<b>"
+        node = node.children[0]
+
+    assert node.children == [Node("NULL")]
+
+
 def test_compare_markup(mocker):
     """Test for markup comparison."""
     mocker.patch("pytransins.utils.convert_to_nodes", return_value=Node("root_node"))
@@ -34,6 +88,111 @@ def test_compare_markup(mocker):
 
     assert result == 0
 
+    clear_compare_markup_cache()
+    mocker.patch(
+        "pytransins.utils.convert_to_nodes",
+        side_effect=[Node("root_node"), Node("other_node")],
+    )
     mocker.patch("pytransins.utils.simple_distance", return_value=1)
-    result = compare_markup("<h>this is a test</h>", "<h>this is a test</h>")
+    result = compare_markup("<h>this is a test</h>", "<h>this is another test</h>")
     assert result == 1
+
+
+def test_compare_markup_same_structure(mocker):
+    """Test that markup differing only in text is not passed to the ZSS algorithm."""
+    spy = mocker.spy(utils, "simple_distance")
+
+    result = compare_markup(
+        "<h>this is <b>a</b> test</h>", "<h>esto es <b>una</b> prueba</h>"
+    )
+
+    assert result == 0
+    spy.assert_not_called()
+
+
+def test_compare_markup_identical(mocker):
+    """Test that identical markup is not converted to trees."""
+    mock_convert = mocker.patch("pytransins.utils.convert_to_nodes")
+
+    result = compare_markup("<h>this is a test</h>", "<h>this is a test</h>")
+
+    assert result == 0
+    mock_convert.assert_not_called()
+
+
+def test_compare_markup_cached(mocker):
+    """Test that compare_markup converts the same markup only once."""
+    spy = mocker.spy(utils, "convert_to_nodes")
+    src = "<h>this is <b>a</b> test</h>"
+
+    compare_markup(src, "<h>this is a test</h>")
+    compare_markup(src, "<h><i>this</i> is a test</h>")
+
+    assert [call.args[0] for call in spy.call_args_list].count(src) == 1
+
+    clear_compare_markup_cache()
+    compare_markup(src, "<h>this is a test</h>")
+
+    assert [call.args[0] for call in spy.call_args_list].count(src) == 2
+
+
+def test_contains_markup():
+    """Test for detecting markup that needs parsing."""
+    assert not contains_markup("this is a test")
+    assert not contains_markup("1 < 2 and 3 <= 4")
+    assert contains_markup("this is <b>a</b> test")
+    assert contains_markup("this is </b> a test")
+    assert contains_markup("this is <!-- a --> test")
+    assert contains_markup("this &amp; that")
+    assert contains_markup("this is a test <")
+
+
+def test_compare_markup_max_distance(mocker):
+    """Test that the tree edit distance is skipped when the size difference exceeds max_distance."""
+    spy = mocker.spy(utils, "simple_distance")
+    src = "<h>this is a test</h>"
+    tgt = "<h><b>this</b> <i>is</i> <u>a</u> <s>test</s></h>"
+
+    assert compare_markup(src, tgt, max_distance=2) == 10
+    spy.assert_not_called()
+
+    assert compare_markup(src, tgt, max_distance=20) == compare_markup(src, tgt)
+    assert spy.call_count == 2
+
+
+def test_get_closing_tag():
+    """Test for deriving closing tags from opening tags."""
+    assert get_closing_tag("<h>") == "</h>"
+    assert get_closing_tag('<a href="http://localhost" class="link">') == "</a>"
+
+
+def test_get_opening_tag():
+    """Test for converting tags to opening tags."""
+    soup = BeautifulSoup("<a href='#' class='link bold'>text</a><b>text</b>", "html.parser")
+
+    assert get_opening_tag(soup.a) == '<a href="#" class="link bold">'
+    assert get_opening_tag(soup.b) == "<b>"
+
+
+def test_parse_markup_lxml():
+    """Test that html and body tags inserted by lxml are removed, but ones in the markup are kept."""
+    pytest.importorskip("lxml")
+
+    soup = parse_markup("<h>this is a test</h>", "lxml")
+    assert str(soup) == "<h>this is a test</h>"
+
+    soup = parse_markup("<html><body><h>this is a test</h></body></html>", "lxml")
+    assert str(soup) == "<html><body><h>this is a test</h></body></html>"
+
+
+def test_parse_markup_lxml_wrapper_not_a_tag():
+    """Test that html and body text in comments, scripts and attributes does not keep the tags lxml inserted."""
+    pytest.importorskip("lxml")
+
+    for test_input in [
+        "<!-- <body> --><p>x</p>",
+        '<script>var a = "<body>";</script><p>x</p>',
+        '<a title="<html>">x</a>',
+    ]:
+        soup = parse_markup(test_input, "lxml")
+        assert str(soup) == str(parse_markup(test_input))